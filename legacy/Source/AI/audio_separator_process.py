@@ -243,10 +243,8 @@ def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs
                     # Rename to standard name
                     new_path = os.path.join(output_dir, f"{stem_name}.wav")
                     if output_file != new_path:
-                        if os.path.exists(new_path):
-                            os.remove(new_path)
-                        import shutil
-                        shutil.move(output_file, new_path)
+                        # Same directory: one atomic rename that also replaces an old stem
+                        os.replace(output_file, new_path)
                     result[stem_name] = new_path
                     print(f"  {stem_name}: {new_path}", file=sys.stderr)
                     break
@@ -17,7 +17,7 @@ import sys
 import os
 import argparse
 import tempfile
-import shutil
+from fractions import Fraction
 from pathlib import Path
 
 def check_dependencies():
@@ -46,8 +46,238 @@ def check_dependencies():
         return False
     return True
 
+def compile_model(model, batch_size: int):
+    """
+    Compile a Demucs model with torch.compile so its forward replays as a CUDA Graph.
+
+    The graph is captured for full batches of segments, so the compiled model
+    must be run with pad_batches=True in apply_model_batched.
+
+    Args:
+        model: Demucs model or BagOfModels, already on the CUDA device
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        The compiled model (a BagOfModels keeps its type, with compiled sub-models)
+    """
+    import torch
+    from demucs.apply import BagOfModels
+
+    def compile_one(sub_model):
+        compiled = torch.compile(sub_model, mode="reduce-overhead", fullgraph=False)
+        segment = int(sub_model.samplerate * sub_model.segment)
+        valid_length = sub_model.valid_length(segment) if hasattr(sub_model, "valid_length") else segment
+        device = next(sub_model.parameters()).device
+        dummy = torch.zeros(batch_size, 2, valid_length, device=device)
+        # First call compiles, second one records the graph
+        for _ in range(2):
+            compiled(dummy)
+        return compiled
+
+    if isinstance(model, BagOfModels):
+        for i, sub_model in enumerate(model.models):
+            model.models[i] = compile_one(sub_model)
+        return model
+    return compile_one(model)
+
+def capture_cuda_graph(model, batch_size: int):
+    """
+    Record a Demucs model's forward pass for full batches of segments as a CUDA Graph.
+
+    Replaying the graph launches all kernels at once, which removes the per-kernel
+    launch overhead. Like compile_model, the result must be run with
+    pad_batches=True in apply_model_batched, and any autocast around the capture
+    must have its cache disabled.
+
+    Only the time-domain models can be captured: the hybrid (spectrogram) models
+    copy tensors to the device inside their forward pass, which isn't allowed
+    while capturing. Those, and any sub-model whose capture fails, run eagerly.
+
+    Args:
+        model: Demucs model or BagOfModels, already on the CUDA device
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        The graphed model (a BagOfModels keeps its type, with graphed sub-models)
+    """
+    import torch
+    from demucs.apply import BagOfModels
+    from demucs.hdemucs import HDemucs
+    from demucs.htdemucs import HTDemucs
+
+    class GraphedModel(torch.nn.Module):
+        """
+        Replays a captured forward pass of a Demucs model.
+
+        A Module, so it can take a sub-model's place in BagOfModels.models (a
+        ModuleList); the attributes apply_model_batched reads are copied over.
+        """
+
+        def __init__(self, sub_model):
+            super().__init__()
+            self.model = sub_model
+            self.samplerate = sub_model.samplerate
+            self.segment = sub_model.segment
+            self.sources = sub_model.sources
+            self.audio_channels = getattr(sub_model, "audio_channels", 2)
+            segment = int(sub_model.samplerate * sub_model.segment)
+            valid_length = sub_model.valid_length(segment) if hasattr(sub_model, "valid_length") else segment
+            device = next(sub_model.parameters()).device
+            self.static_input = torch.zeros(batch_size, 2, valid_length, device=device)
+
+            # Warm up on a side stream so lazy initialization isn't captured
+            side_stream = torch.cuda.Stream(device)
+            side_stream.wait_stream(torch.cuda.current_stream(device))
+            with torch.cuda.stream(side_stream):
+                for _ in range(3):
+                    sub_model(self.static_input)
+            torch.cuda.current_stream(device).wait_stream(side_stream)
+
+            self.graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self.graph):
+                self.static_output = sub_model(self.static_input)
+
+        def valid_length(self, length: int):
+            return self.model.valid_length(length) if hasattr(self.model, "valid_length") else length
+
+        def forward(self, batch):
+            # The output is overwritten by the next call; callers consume it first
+            self.static_input.copy_(batch)
+            self.graph.replay()
+            return self.static_output
+
+    def capture(sub_model):
+        if isinstance(sub_model, (HDemucs, HTDemucs)):
+            print(f"WARNING: {type(sub_model).__name__} can't be captured as a CUDA Graph, "
+                  "running it eagerly", file=sys.stderr)
+            return sub_model
+        try:
+            return GraphedModel(sub_model)
+        except RuntimeError as e:
+            print(f"WARNING: CUDA Graph capture failed, running eagerly: {e}", file=sys.stderr)
+            torch.cuda.synchronize()
+            return sub_model
+
+    if isinstance(model, BagOfModels):
+        for i, sub_model in enumerate(model.models):
+            model.models[i] = capture(sub_model)
+        return model
+    return capture(model)
+
+def apply_model_batched(model, mix, batch_size: int = 4, overlap: float = 0.25,
+                        pad_batches: bool = False, device=None):
+    """
+    Run a Demucs model over overlapping segments, several segments per forward pass.
+
+    Same overlap-add scheme as demucs.apply.apply_model (without random shifts),
+    but segments are stacked into batches so each forward call does more work.
+
+    The mix and the output stay on the mix's device. If the model runs on another
+    device, only one batch of segments at a time is moved there, which bounds its
+    memory use regardless of the track's length.
+
+    Args:
+        model: Demucs model or BagOfModels, already on `device`
+        mix: Tensor of shape [channels, samples]
+        batch_size: Number of segments per forward pass
+        overlap: Fraction of each segment shared with the next one
+        pad_batches: Zero-pad the last batch to batch_size (keeps shapes fixed)
+        device: Device the model runs on (default: the mix's device)
+
+    Returns:
+        Tensor of shape [sources, channels, samples]
+    """
+    import torch
+    import tqdm
+    from demucs.apply import BagOfModels
+
+    if isinstance(model, BagOfModels):
+        # Weighted average of the sub-models, per source
+        out = None
+        totals = [0.0] * len(model.sources)
+        for sub_model, weights in zip(model.models, model.weights):
+            sub_out = apply_model_batched(sub_model, mix, batch_size, overlap, pad_batches, device)
+            for k, weight in enumerate(weights):
+                sub_out[k] *= weight
+                totals[k] += weight
+            out = sub_out if out is None else out.add_(sub_out)
+            del sub_out
+        for k, total in enumerate(totals):
+            out[k] /= total
+        return out
+
+    device = torch.device(device) if device else mix.device
+    channels, length = mix.shape
+    if length == 0:
+        # No segments to run; the padding below needs at least one
+        return mix.new_zeros(len(model.sources), channels, 0, dtype=torch.float32)
+    segment = int(model.samplerate * model.segment)
+    stride = int((1 - overlap) * segment)
+    offsets = range(0, length, stride)
+
+    # Each segment is fed with the surrounding audio up to the model's valid length
+    valid_length = model.valid_length(segment) if hasattr(model, "valid_length") else segment
+    pad_left = (valid_length - segment) // 2
+    pad_right = offsets[-1] + valid_length - pad_left - length
+    padded = torch.nn.functional.pad(mix, (pad_left, pad_right))
+    windows = padded.unfold(-1, valid_length, stride).transpose(0, 1)  # [n, channels, valid_length]
+
+    # Triangle weight peaking in the middle of the segment, as in apply_model
+    weight = torch.cat([torch.arange(1, segment // 2 + 1, device=device),
+                        torch.arange(segment - segment // 2, 0, -1, device=device)]).float()
+    weight /= weight.max()
+    out_weight = weight.to(mix.device)
+
+    out = torch.zeros(len(model.sources), channels, length + segment, device=mix.device)
+    sum_weight = torch.zeros(length + segment, device=mix.device)
+
+    # Segments streamed from host memory go through two pinned buffers, copied on
+    # a side stream: the upload of the next batch overlaps the current forward pass
+    staged = device.type == "cuda" and mix.device.type == "cpu"
+    if staged:
+        staging = [torch.empty((batch_size, channels, valid_length), pin_memory=True) for _ in range(2)]
+        copy_stream = torch.cuda.Stream(device)
+
+    def load_batch(number: int):
+        start = number * batch_size
+        batch = windows[start:start + batch_size]
+        if pad_batches and len(batch) < batch_size:
+            batch = torch.cat([batch, batch.new_zeros(batch_size - len(batch), *batch.shape[1:])])
+        if not staged:
+            return batch.contiguous().to(device, non_blocking=True)
+        buffer = staging[number % 2][:len(batch)]
+        buffer.copy_(batch)
+        with torch.cuda.stream(copy_stream):
+            return buffer.to(device, non_blocking=True)
+
+    batch_count = (len(offsets) + batch_size - 1) // batch_size
+    next_batch = load_batch(0)
+    for number in tqdm.tqdm(range(batch_count), file=sys.stderr):
+        start = number * batch_size
+        batch = next_batch
+        if staged:
+            compute_stream = torch.cuda.current_stream(device)
+            compute_stream.wait_stream(copy_stream)
+            batch.record_stream(compute_stream)
+        if number + 1 < batch_count:
+            # The buffer it goes into was last read by the upload of the previous
+            # batch, which finished before that batch's output came back
+            next_batch = load_batch(number + 1)
+        batch_out = model(batch)
+        trim = (batch_out.shape[-1] - segment) // 2
+        batch_out = (batch_out[..., trim:trim + segment] * weight).to(mix.device)
+        for j, offset in enumerate(offsets[start:start + batch_size]):
+            out[..., offset:offset + segment] += batch_out[j]
+            sum_weight[offset:offset + segment] += out_weight
+        del batch_out
+
+    out = out[..., :length]
+    out /= sum_weight[:length]
+    return out
+
 def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs",
-                   device: str = "cuda", two_stems: str = None):
+                   device: str = "cuda", two_stems: str = None, batch_size: int = 4,
+                   use_compile: bool = False, precision: str = "auto", use_cuda_graph: bool = False):
     """
     Separate audio into stems using Demucs.
 
@@ -57,6 +287,12 @@ def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs
         model_name: Demucs model to use (htdemucs, htdemucs_ft, mdx_extra)
         device: Device to use (cuda, cpu)
         two_stems: If set, only separate into two stems (e.g., "vocals")
+        batch_size: Number of overlapping segments per forward pass
+        use_compile: Compile the model with torch.compile / CUDA Graphs (CUDA only)
+        precision: auto (fp16/bf16 autocast on CUDA, fp32 on CPU), fp32, bf16,
+                   or int8 (dynamic quantization, CPU only)
+        use_cuda_graph: Capture the forward pass as a CUDA Graph (CUDA only,
+                        ignored with use_compile, which already uses CUDA Graphs)
 
     Returns:
         dict: Paths to output stem files
@@ -66,75 +302,145 @@ def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs
     import numpy as np
     from scipy import signal
     from demucs.pretrained import get_model
-    from demucs.apply import apply_model
 
     # Check device availability
     if device == "cuda" and not torch.cuda.is_available():
         print("CUDA not available, falling back to CPU", file=sys.stderr)
         device = "cpu"
 
+    if device == "cuda":
+        # Segments have a fixed shape, so let cuDNN autotune its conv algorithms once
+        torch.backends.cudnn.benchmark = True
+        torch.set_float32_matmul_precision("high")
+
     print(f"Loading model: {model_name}", file=sys.stderr)
     model = get_model(model_name)
-    model.to(device)
     model.eval()
 
     print(f"Loading audio: {input_file}", file=sys.stderr)
 
-    # Load audio using soundfile
-    audio_data, sample_rate = sf.read(input_file, dtype='float32')
-    
-    # Convert to torch tensor with shape [channels, samples]
-    if audio_data.ndim == 1:
-        # Mono - convert to stereo
-        waveform = torch.from_numpy(audio_data).unsqueeze(0).repeat(2, 1)
+    # Stream the file block by block into a tensor, staged in pinned memory on
+    # CUDA (mono stays single-channel until it reaches the device). It keeps
+    # soundfile's [samples, channels] layout so every block is a straight copy
+    info = sf.info(input_file)
+    sample_rate = info.samplerate
+    channels = min(info.channels, 2)
+
+    # The separated sources take len(sources) times the (stereo) mix. If they
+    # would fill more than half of the free VRAM, keep the mix and the output
+    # in host memory and only send one batch of segments at a time to the GPU
+    keep_on_host = False
+    if device == "cuda":
+        output_bytes = len(model.sources) * 2 * 4 * info.frames * model.samplerate // sample_rate
+        free_memory, _ = torch.cuda.mem_get_info()
+        if output_bytes > 0.5 * free_memory:
+            print("Long track: keeping audio in host memory, streaming segments to the GPU",
+                  file=sys.stderr)
+            keep_on_host = True
+    host = torch.empty((info.frames, channels), dtype=torch.float32, pin_memory=(device == "cuda"))
+    offset = 0
+    for block in sf.blocks(input_file, blocksize=1 << 20, dtype="float32", always_2d=True):
+        host[offset:offset + len(block)].copy_(torch.from_numpy(block[:, :channels]))
+        offset += len(block)
+    host = host[:offset]
+    if offset == 0:
+        raise ValueError(f"Input file contains no audio: {input_file}")
+
+    if device == "cuda" and not keep_on_host:
+        # Asynchronous upload, overlaps with moving the model weights below;
+        # the transpose to [channels, samples] is then done by the GPU
+        waveform = host.to(device, non_blocking=True).transpose(0, 1).contiguous()
     else:
-        # Transpose from [samples, channels] to [channels, samples]
-        waveform = torch.from_numpy(audio_data.T)
-        if waveform.shape[0] > 2:
-            waveform = waveform[:2]
-        elif waveform.shape[0] == 1:
-            waveform = waveform.repeat(2, 1)
+        # Strided view; the padding in apply_model_batched makes it contiguous
+        waveform = host.transpose(0, 1)
+    del host
+    model.to(device)
+    if device == "cuda":
+        # NHWC layout for the spectrogram-branch Conv2d weights (Tensor Core kernels)
+        model.to(memory_format=torch.channels_last)
+
+    if precision == "int8":
+        if device == "cpu":
+            print("Quantizing model to int8...", file=sys.stderr)
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+        else:
+            print("int8 is only supported on CPU, using default precision", file=sys.stderr)
+            precision = "auto"
 
     # Resample if needed (Demucs expects 44100 Hz)
     if sample_rate != model.samplerate:
         print(f"Resampling from {sample_rate} to {model.samplerate} Hz", file=sys.stderr)
-        # Use scipy for resampling
-        num_samples = int(waveform.shape[1] * model.samplerate / sample_rate)
-        resampled = np.zeros((waveform.shape[0], num_samples), dtype=np.float32)
-        for ch in range(waveform.shape[0]):
-            resampled[ch] = signal.resample(waveform[ch].numpy(), num_samples)
-        waveform = torch.from_numpy(resampled)
+        if waveform.is_cuda:
+            # Resample on the GPU to avoid a CPU roundtrip; a wider Kaiser-windowed
+            # sinc keeps the passband flat up to close to the new Nyquist frequency
+            import torchaudio.functional as AF
+            waveform = AF.resample(waveform, sample_rate, model.samplerate,
+                                   lowpass_filter_width=16, resampling_method="sinc_interp_kaiser")
+        else:
+            # Polyphase resampling: cost doesn't depend on the length's prime factors
+            ratio = Fraction(model.samplerate, sample_rate).limit_denominator(1000)
+            resampled = signal.resample_poly(waveform.numpy(), ratio.numerator, ratio.denominator, axis=1)
+            waveform = torch.from_numpy(resampled.astype(np.float32, copy=False))
         sample_rate = model.samplerate
 
-    # Add batch dimension
-    waveform = waveform.unsqueeze(0).to(device)
+    if not keep_on_host:
+        waveform = waveform.to(device)
+    if waveform.shape[0] == 1:
+        # Mono - convert to stereo as a zero-copy view; padding in
+        # apply_model_batched materializes it on the device
+        waveform = waveform.expand(2, -1)
 
     print(f"Processing on {device}...", file=sys.stderr)
 
-    # Apply model
-    with torch.no_grad():
-        sources = apply_model(model, waveform, device=device, progress=True)
-
-    # sources shape: [batch, sources, channels, samples]
-    sources = sources[0]  # Remove batch dimension
-
+    # Apply model, under mixed precision unless fp32/int8 was requested
+    use_amp = precision == "bf16" or (precision == "auto" and device == "cuda")
+    amp_dtype = torch.bfloat16
+    if precision == "auto" and device == "cuda" and not torch.cuda.is_bf16_supported():
+        amp_dtype = torch.float16
+    compiled = use_compile and device == "cuda" and hasattr(torch, "compile")
+    graphed = use_cuda_graph and device == "cuda" and not compiled
+    # Autocast's weight cache doesn't survive a CUDA Graph capture
+    with torch.inference_mode(), torch.autocast(device_type=device, dtype=amp_dtype, enabled=use_amp,
+                                                cache_enabled=not graphed):
+        if compiled:
+            print("Compiling model...", file=sys.stderr)
+            model = compile_model(model, batch_size)
+        elif graphed:
+            print("Capturing CUDA Graph...", file=sys.stderr)
+            model = capture_cuda_graph(model, batch_size)
+        sources = apply_model_batched(model, waveform, batch_size=batch_size,
+                                      pad_batches=compiled or graphed, device=device)
+
+    # The input isn't needed anymore; release it before writing
+    del waveform
+
+    # sources shape: [sources, channels, samples]
     # Get source names from model
     source_names = model.sources  # e.g., ['drums', 'bass', 'other', 'vocals']
 
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
 
-    # Save each stem using soundfile
+    # Save each stem using soundfile, streaming it in blocks so only one
+    # small contiguous chunk is copied to the host at a time
+    block_size = 1 << 18
     output_files = {}
     for i, name in enumerate(source_names):
-        stem = sources[i].cpu().numpy()
-        # Transpose from [channels, samples] to [samples, channels] for soundfile
-        stem = stem.T
         output_path = os.path.join(output_dir, f"{name}.wav")
-        sf.write(output_path, stem, sample_rate)
+        with sf.SoundFile(output_path, "w", samplerate=sample_rate, channels=sources.shape[1]) as f:
+            for start in range(0, sources.shape[-1], block_size):
+                # Transpose from [channels, samples] to [samples, channels] for soundfile
+                block = sources[i, :, start:start + block_size].transpose(0, 1).contiguous()
+                f.write(block.cpu().numpy())
         output_files[name] = output_path
         print(f"Saved: {output_path}", file=sys.stderr)
 
+    # Hand the separated sources' memory back to the driver
+    del sources
+    if device == "cuda":
+        torch.cuda.empty_cache()
+
     return output_files
 
 def main():
@@ -148,6 +454,15 @@ def main():
                         help="Device to use for processing")
     parser.add_argument("--two-stems", default=None,
                         help="Only separate into two stems (e.g., 'vocals')")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Number of overlapping segments per forward pass")
+    parser.add_argument("--compile", action="store_true",
+                        help="Compile the model with torch.compile (CUDA only, slow first run)")
+    parser.add_argument("--cuda-graph", action="store_true",
+                        help="Capture the forward pass as a CUDA Graph (CUDA only, time-domain "
+                             "models such as mdx_extra; others run eagerly)")
+    parser.add_argument("--precision", default="auto", choices=["auto", "fp32", "bf16", "int8"],
+                        help="Inference precision (int8 is CPU only)")
     parser.add_argument("--check", action="store_true",
                         help="Only check dependencies, don't process")
 
@@ -184,7 +499,11 @@ def main():
             args.output_dir,
             model_name=args.model,
             device=args.device,
-            two_stems=args.two_stems
+            two_stems=args.two_stems,
+            batch_size=args.batch_size,
+            use_compile=args.compile,
+            precision=args.precision,
+            use_cuda_graph=args.cuda_graph
         )
 
         # Print output paths as JSON for parsing
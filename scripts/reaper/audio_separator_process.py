@@ -7,6 +7,16 @@ NOTE: The -u flag enables unbuffered stdout for real-time progress output.
 
 Usage:
     python audio_separator_process.py <input.wav> <output_dir> [--model htdemucs] [--device auto|cpu|cuda: 0|cuda:1]
+    python audio_separator_process.py <a.wav> <b.wav> ... <output_dir>
+        (one model load for all files; stems go to <output_dir>/<file name>/, prints a list of results)
+    python audio_separator_process.py --serve [--model htdemucs] [--device auto]
+        (reads {"input": ..., "output_dir": ...} JSON lines from stdin, one result line per job)
+    python audio_separator_process.py --serve --socket [ADDRESS] [--model htdemucs] [--device auto]
+        (same, as a daemon listening on a local socket / named pipe)
+    python audio_separator_process.py <input.wav> <output_dir> --client [--socket ADDRESS]
+        (run the job on the daemon; falls back to separating in-process if none is running)
+    python audio_separator_process.py --batch-manifest jobs.json [--jobs N] [--model htdemucs]
+        (jobs.json is a list of {"input": ..., "output_dir": ...}; prints a list of results)
 
 Models:
     - htdemucs (default): Facebook's Hybrid Transformer Demucs
@@ -27,24 +37,559 @@ Outputs:
     <output_dir>/bass.wav
     <output_dir>/other.wav
 
-Progress output (stdout):
+Progress output (stdout, or the file descriptor given with --progress-fd):
     PROGRESS: <percent>: <stage>
     Example: PROGRESS:45:Processing chunk 3/8
 """
 
 import sys
 import os
+import re
+import time
 import argparse
+import contextlib
+import functools
 import json
+import logging
+import secrets
+import socket
+import struct
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
+
+# Persistent cache: audio-separator's default model dir is under /tmp, so models
+# would be downloaded again after every reboot
+CACHE_DIR = Path(os.environ.get("STEMPERATOR_CACHE_DIR", Path.home() / ".cache" / "stemperator"))
+MODEL_DIR = CACHE_DIR / "models"
+
+# Must be set before torch is imported; keeps torch.compile kernels across runs
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(CACHE_DIR / "inductor"))
+# Grow allocations in place instead of splitting fixed blocks, so several
+# jobs (--batch-manifest, --serve) can share a GPU without fragmenting it
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF",
+                      "expandable_segments:True,max_split_size_mb:512,garbage_collection_threshold:0.8")
+# Load CUDA kernels on first use instead of all at context creation (CUDA 11.7+):
+# faster startup and less VRAM taken by kernels the models never run
+os.environ.setdefault("CUDA_MODULE_LOADING", "LAZY")
+
+# CPU inference scales badly past the physical cores (hyperthreads just thrash
+# the caches), so default the BLAS/OpenMP pools to half the logical CPUs.
+# Read when numpy/torch are imported, hence before the soundfile import below.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+for var in THREAD_ENV_VARS:
+    os.environ.setdefault(var, str(max(1, (os.cpu_count() or 2) // 2)))
+
+# torch and audio_separator are imported where they are first needed, so that
+# --check can report them missing and --list-models stays instant
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+# Map short names to full model names used by audio-separator
+MODEL_MAPPING = {
+    'htdemucs':  'htdemucs.yaml',
+    'htdemucs_ft': 'htdemucs_ft.yaml',
+    'htdemucs_6s': 'htdemucs_6s.yaml',
+    'hdemucs_mmi': 'hdemucs_mmi.yaml',
+}
+
+# audio-separator's per-architecture defaults; passing a params dict replaces them as a whole
+DEMUCS_PARAMS = {"segment_size": "Default", "shifts": 2, "overlap": 0.25, "segments_enabled": True}
+MDX_PARAMS = {"hop_length": 1024, "segment_size": 256, "overlap": 0.25, "batch_size": 1, "enable_denoise": False}
+MDXC_PARAMS = {"segment_size": 256, "override_model_segment_size": False, "batch_size": 1, "overlap": 8,
+               "pitch_shift": 0}
+
+# GPU memory per window in an MDX/MDXC batch, used to pick the default --batch-size
+BATCH_WINDOW_GPU_MEMORY = 1.5 * 1024 ** 3
+MAX_AUTO_BATCH_SIZE = 8
+
+# Transformer Demucs models can't run segments longer than they were trained on (7.8 s)
+HTDEMUCS_MAX_SEGMENT = 7
+
+# Rough peak GPU memory of one separation, used to size --batch-manifest concurrency
+JOB_GPU_MEMORY = 3 * 1024 ** 3
+# Each concurrent worker loads its own model first, one after another, and
+# the GPU is saturated well before that many loads pay off; --jobs overrides
+MAX_AUTO_CONCURRENCY = 2
+
+# Size in bytes of the secret that --serve --socket clients authenticate with
+AUTH_KEY_SIZE = 32
+
+# Output file name patterns for each standard stem name, in matching order
+STEM_MAPPING = {
+    'vocals': ['vocals', 'vocal', 'Vocals'],
+    'drums':  ['drums', 'drum', 'Drums'],
+    'bass': ['bass', 'Bass'],
+    'other': ['other', 'Other', 'no_vocals', 'instrumental', 'Instrumental'],
+    'guitar': ['guitar', 'Guitar'],
+    'piano': ['piano', 'Piano', 'keys', 'Keys']
+}
+
+# All patterns in one alternation with a named group per stem, so a match's
+# lastgroup is the stem name. Longest first within a group ("vocals" before
+# "vocal"); "no_vocals" wins over "vocals" anyway, as it matches further left
+STEM_PATTERN = re.compile("|".join(
+    "(?P<%s>%s)" % (stem, "|".join(sorted({re.escape(p.lower()) for p in patterns}, key=len, reverse=True)))
+    for stem, patterns in STEM_MAPPING.items()), re.IGNORECASE)
+
+# soundfile subtype names of the WAV sample formats read_wav_info understands,
+# by (format tag, bits per sample)
+WAV_SUBTYPES = {(1, 8): "PCM_U8", (1, 16): "PCM_16", (1, 24): "PCM_24", (1, 32): "PCM_32",
+                (3, 32): "FLOAT", (3, 64): "DOUBLE"}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# audio-separator names outputs "<input>_(<Stem>)_<model>"
+STEM_LABEL_PATTERN = re.compile(r"\(([^()]*)\)")
+
+def get_stem_name(filename: str):
+    """
+    Map an output file name to a standard stem name, or None.
+
+    The stem label in parentheses is checked first, then the whole name; in
+    both, the last pattern found wins, since the input's own name comes first
+    (a song called "Drum and Bass" must not make every stem "drums").
+    """
+    labels = STEM_LABEL_PATTERN.findall(filename)
+    for text in (labels[-1] if labels else "", filename):
+        matches = list(STEM_PATTERN.finditer(text))
+        if matches:
+            return matches[-1].lastgroup
+    return None
+
+# File descriptor PROGRESS lines go to; --progress-fd moves them off stdout
+progress_fd = 1
 
 def emit_progress(percent:  float, stage: str = ""):
     """Output progress in machine-readable format for C++ to parse."""
-    sys.stdout.write(f"PROGRESS:{int(percent)}:{stage}\n")
-    sys.stdout.flush()
+    # One unbuffered write per line: no flush, and lines from worker threads can't interleave
+    os.write(progress_fd, b"PROGRESS:%d:%s\n" % (int(percent), stage.encode("utf-8", "replace")))
+
+class ProgressSink:
+    """
+    Turns tqdm's chunk counts into PROGRESS lines.
+
+    Separation may run several passes (Demucs shifts, bags of models), each with
+    its own bar; the passes are laid out one after another between start and end.
+    The ETA comes from an exponential moving average of the time per percent
+    of progress, measured from the first bar (model setup before it doesn't count).
+    """
+
+    # Weight of the newest timing sample in the moving average
+    ETA_SMOOTHING = 0.3
+
+    def __init__(self, start: int, end: int, device_name: str, passes: int = 1, progress=emit_progress):
+        self.progress = progress
+        self.start = start
+        self.end = end
+        self.device_name = device_name
+        self.passes = max(1, passes)
+        self.current_pass = -1
+        self.last_percent = start
+        self.start_time = time.monotonic()
+        self.last_time = self.start_time
+        self.last_fraction = 0.0
+        self.seconds_per_fraction = None
+
+    def start_pass(self):
+        """Called when a new bar is created."""
+        if self.current_pass < 0:
+            self.last_time = time.monotonic()
+        self.current_pass = min(self.current_pass + 1, self.passes - 1)
+
+    def update(self, done: int, total: int):
+        """Called with the bar's completed and total chunk counts."""
+        if not total:
+            return
+        fraction = min(1.0, (max(0, self.current_pass) + min(done / total, 1.0)) / self.passes)
+        percent = max(self.last_percent, int(self.start + fraction * (self.end - self.start)))
+        if percent == self.last_percent:
+            return
+        self.last_percent = percent
+
+        now = time.monotonic()
+        if fraction > self.last_fraction:
+            sample = (now - self.last_time) / (fraction - self.last_fraction)
+            if self.seconds_per_fraction is None:
+                self.seconds_per_fraction = sample
+            else:
+                self.seconds_per_fraction += self.ETA_SMOOTHING * (sample - self.seconds_per_fraction)
+            self.last_time, self.last_fraction = now, fraction
+
+        elapsed = int(now - self.start_time)
+        eta_str = ""
+        if self.seconds_per_fraction is not None:
+            remaining = int((1.0 - fraction) * self.seconds_per_fraction)
+            eta_str = " | ETA %d:%02d" % divmod(remaining, 60)
+        self.progress(percent, "Processing (%d:%02d%s) [%s]" % (*divmod(elapsed, 60), eta_str, self.device_name))
+
+    # tqdm still writes the odd newline to its file; swallow it
+    def write(self, text: str):
+        pass
+
+    def flush(self):
+        pass
+
+class BatchProgress:
+    """
+    Combines the progress of several concurrent jobs into one PROGRESS stream.
+
+    The reported percent is the average over all jobs; the stage is prefixed
+    with the index of the job that reported it.
+    """
+
+    def __init__(self, job_count: int):
+        self.percents = [0] * job_count
+        self.lock = threading.Lock()
+
+    def for_job(self, index: int):
+        """Return an emit_progress-like callable for one job."""
+        def progress(percent: float, stage: str = ""):
+            with self.lock:
+                self.percents[index] = percent
+                overall = sum(self.percents) / len(self.percents)
+                emit_progress(overall, f"[{index + 1}/{len(self.percents)}] {stage}")
+        return progress
+
+# tqdm is patched while any thread is inside redirect_tqdm; each thread's bars
+# go to the sink that thread registered
+tqdm_sinks = threading.local()
+tqdm_patch = {"depth": 0, "original": None, "modules": []}
+tqdm_patch_lock = threading.Lock()
+
+@contextlib.contextmanager
+def redirect_tqdm(sink):
+    """Report every tqdm bar created by this thread inside the block to the given sink."""
+    import tqdm
+
+    with tqdm_patch_lock:
+        if tqdm_patch["depth"] == 0:
+            original = tqdm.tqdm
+
+            class patched(original):
+                """tqdm that reports its counts to the thread's sink instead of drawing."""
+
+                def __init__(self, *args, **kwargs):
+                    self.progress_sink = getattr(tqdm_sinks, "sink", None)
+                    if self.progress_sink is not None:
+                        kwargs["file"] = self.progress_sink
+                        self.progress_sink.start_pass()
+                    # Report at most twice a second (tqdm's default is 10x)
+                    kwargs.setdefault("mininterval", 0.5)
+                    super().__init__(*args, **kwargs)
+
+                def display(self, msg=None, pos=None):
+                    if self.progress_sink is None:
+                        return super().display(msg, pos)
+                    self.progress_sink.update(self.n, self.total)
+                    return True
+
+            # Modules that did `from tqdm import tqdm` hold their own reference
+            modules = [m for name, m in list(sys.modules.items())
+                       if name.startswith("audio_separator") and getattr(m, "tqdm", None) is original]
+            tqdm.tqdm = patched
+            for module in modules:
+                module.tqdm = patched
+            tqdm_patch.update(original=original, modules=modules)
+        tqdm_patch["depth"] += 1
+    tqdm_sinks.sink = sink
+    try:
+        yield sink
+    finally:
+        tqdm_sinks.sink = None
+        with tqdm_patch_lock:
+            tqdm_patch["depth"] -= 1
+            if tqdm_patch["depth"] == 0:
+                tqdm.tqdm = tqdm_patch["original"]
+                for module in tqdm_patch["modules"]:
+                    module.tqdm = tqdm_patch["original"]
+
+def read_wav_info(input_file: str):
+    """
+    Read a WAV file's format and length straight from its RIFF header.
+
+    Returns an object with the sf.info attributes used here (samplerate,
+    channels, frames, duration, subtype), or None for anything but a plain
+    PCM or float WAV, which is left to sf.info.
+    """
+    with open(input_file, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12).ljust(12, b"\0"))
+        if riff != b"RIFF" or wave != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"data":
+                break
+            if chunk_id == b"fmt ":
+                fmt = f.read(size)
+            else:
+                f.seek(size, os.SEEK_CUR)
+            # Chunks are padded to an even size
+            f.seek(size % 2, os.SEEK_CUR)
+        # Streamed writers may leave the data size at 0 or 0xFFFFFFFF
+        data_size = os.fstat(f.fileno()).st_size - f.tell()
+        if 0 < size < data_size:
+            data_size = size
+
+    if fmt is None or len(fmt) < 16:
+        return None
+    format_tag, channels, samplerate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # The actual format is the first two bytes of the sub-format GUID
+        format_tag, = struct.unpack("<H", fmt[24:26])
+    subtype = WAV_SUBTYPES.get((format_tag, bits))
+    if subtype is None or not channels or not samplerate or not block_align:
+        return None
+    frames = data_size // block_align
+    return SimpleNamespace(samplerate=samplerate, channels=channels, frames=frames,
+                           duration=frames / samplerate, subtype=subtype)
+
+@functools.lru_cache(maxsize=64)
+def probe_audio_cached(input_file: str, mtime_ns: int, size: int):
+    try:
+        return read_wav_info(input_file) or sf.info(input_file)
+    except Exception:
+        return None
+
+def probe_audio(input_file: str):
+    """
+    Format and length of an audio file (like sf.info), or None if it can't be read.
+
+    WAV headers are parsed directly, other formats go through sf.info. Results
+    are cached until the file changes, as batch mode probes every file up front.
+    """
+    try:
+        stat = os.stat(input_file)
+    except OSError:
+        return None
+    return probe_audio_cached(input_file, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=1)
+def get_soxr():
+    """The soxr module (a librosa dependency), or None if it isn't installed."""
+    try:
+        import soxr
+    except ImportError:
+        return None
+    return soxr
+
+def read_audio(input_file: str, info, sample_rate: int = None):
+    """
+    Decode a whole file with soundfile straight into one preallocated float32 buffer.
+
+    If sample_rate differs from the file's, the whole mix is resampled once
+    with soxr, at the same quality as librosa.load's default.
+
+    Returns [samples, channels] for stereo and [samples] for mono, which is
+    what the separators' prepare_mix expects for an ndarray input.
+    """
+    import numpy as np
+
+    buffer = np.empty((info.frames, info.channels), dtype=np.float32)
+    with sf.SoundFile(input_file) as f:
+        frames = f.read(out=buffer)
+    buffer = buffer[:len(frames)]
+    if sample_rate and sample_rate != info.samplerate:
+        buffer = get_soxr().resample(buffer, info.samplerate, sample_rate, quality="HQ")
+    return buffer[:, 0] if info.channels == 1 else buffer
+
+def can_preload(info, sample_rate: int):
+    """
+    Whether read_audio output can replace the separator's own loading.
+
+    Needs mono or stereo, soxr if the file must be resampled, and an exact
+    frame count for the preallocated buffer: PCM or float data (WAV, AIFF,
+    FLAC...). Lossy formats like MP3 only report an estimate, so they keep
+    the library's loader.
+    """
+    return (sf is not None and info is not None and info.channels in (1, 2) and sample_rate is not None
+            and (info.samplerate == sample_rate or get_soxr() is not None)
+            and (info.subtype.startswith("PCM") or info.subtype in ("FLOAT", "DOUBLE")))
+
+def load_input(input_file: str, sample_rate: int):
+    """
+    Probe and decode an input file ahead of time (used to prefetch the next batch job).
+
+    Returns:
+        tuple: (info, mix); either is None if the file can't be probed or preloaded
+    """
+    info = probe_audio(input_file)
+    if info is None:
+        return None, None
+    if not can_preload(info, sample_rate):
+        return info, None
+    try:
+        return info, read_audio(input_file, info, sample_rate)
+    except Exception:
+        # Let the separator's own loader report the problem
+        return info, None
+
+@contextlib.contextmanager
+def preloaded_mix(model_instance, input_file: str, info, mix=None):
+    """
+    Make the separator use read_audio for input_file instead of librosa.load.
+
+    Only applies to files can_preload accepts (resampled to the model's rate
+    if needed); otherwise the separator's own loading is left untouched. A mix decoded
+    earlier by load_input can be passed in to skip decoding altogether.
+    """
+    sample_rate = getattr(model_instance, "sample_rate", None)
+    if not can_preload(info, sample_rate):
+        yield
+        return
+
+    original = model_instance.prepare_mix
+
+    def prepare_mix(path_or_mix):
+        mix_data = path_or_mix
+        if isinstance(path_or_mix, str) and path_or_mix == input_file:
+            mix_data = mix if mix is not None else read_audio(input_file, info, sample_rate)
+            if not mix_data.any():
+                raise ValueError(f"Audio file {input_file} is empty or not valid")
+        return original(mix_data)
 
+    model_instance.prepare_mix = prepare_mix
+    try:
+        yield
+    finally:
+        del model_instance.prepare_mix
+
+@contextlib.contextmanager
+def background_writes(model_instance, max_workers: int = 4):
+    """
+    Let the separator write its stems from a thread pool.
+
+    audio-separator normalizes, converts and writes each stem to a 16-bit WAV
+    one after another inside separate(); here each write_audio call is queued
+    instead, so the stems are written concurrently. All writes have finished
+    (and their errors are raised) when the block exits.
+    """
+    original = model_instance.write_audio
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def write_audio(stem_path, stem_source):
+            futures.append(pool.submit(original, stem_path, stem_source))
+
+        model_instance.write_audio = write_audio
+        try:
+            yield
+        finally:
+            del model_instance.write_audio
+    for future in futures:
+        future.result()
+
+def quantize_int8(model):
+    """Dynamically quantize a model's Linear and LSTM layers to int8 (CPU inference)."""
+    import torch
+    print("Using int8 dynamic quantization", file=sys.stderr)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+
+def compile_model(model):
+    """
+    torch.compile a model in place (kernel fusion, CUDA Graph replay).
+
+    Compiling in place keeps the module's type and attributes, which Demucs'
+    apply_model and demucs_segments rely on. A BagOfModels is never called
+    itself, so its sub-models are compiled instead. The first forward pass
+    of each input shape pays the compile time.
+    """
+    from audio_separator.separator.uvr_lib_v5.demucs.apply import BagOfModels
+
+    modules = model.models if isinstance(model, BagOfModels) else [model]
+    if not all(hasattr(module, "compile") for module in modules):
+        # nn.Module.compile needs torch 2.2+
+        print("WARNING: --compile needs a newer PyTorch, running the model uncompiled", file=sys.stderr)
+        return model
+    print("Compiling model (the first chunks take longer)", file=sys.stderr)
+    for module in modules:
+        module.compile(mode="reduce-overhead", fullgraph=False)
+    return model
+
+# get_demucs_model is patched while any thread is inside demucs_loader; each
+# thread gets the models of the separator it registered
+demucs_loaders = threading.local()
+demucs_patch = {"depth": 0, "original": None}
+demucs_patch_lock = threading.Lock()
+
+# Model loading (torch.load / torch.jit.load) can deadlock when several threads
+# load at once; concurrent batch workers build their Demucs models inside
+# separate(), so every load goes through this lock
+model_load_lock = threading.Lock()
+
+def get_demucs_model(*args, **kwargs):
+    """Stand-in for audio-separator's get_demucs_model, see demucs_loader."""
+    separator = getattr(demucs_loaders, "separator", None)
+    if separator is None:
+        return demucs_patch["original"](*args, **kwargs)
+
+    key = (args, tuple(sorted(kwargs.items())))
+    if key not in separator.demucs_models:
+        with model_load_lock:
+            model = demucs_patch["original"](*args, **kwargs)
+        for hook in separator.model_hooks:
+            model = hook(model)
+        separator.demucs_models[key] = model
+    return separator.demucs_models[key]
+
+@contextlib.contextmanager
+def demucs_loader(separator):
+    """
+    Keep the Demucs model audio-separator loads inside separate() across calls.
+
+    DemucsSeparator builds its model on every separate() call through the
+    module-level get_demucs_model, so that is patched for the duration. The
+    first call loads the model and applies the separator's model hooks (see
+    load_separator); later calls, e.g. the next file in --serve or batch mode,
+    reuse it along with anything compiled for it.
+    """
+    from audio_separator.separator.architectures import demucs_separator
+
+    # Checked by type: separate() deletes demucs_model_instance after every run
+    if not isinstance(separator.model_instance, demucs_separator.DemucsSeparator):
+        yield
+        return
+
+    with demucs_patch_lock:
+        if demucs_patch["depth"] == 0:
+            demucs_patch["original"] = demucs_separator.get_demucs_model
+            demucs_separator.get_demucs_model = get_demucs_model
+        demucs_patch["depth"] += 1
+    demucs_loaders.separator = separator
+    try:
+        yield
+    finally:
+        demucs_loaders.separator = None
+        with demucs_patch_lock:
+            demucs_patch["depth"] -= 1
+            if demucs_patch["depth"] == 0:
+                demucs_separator.get_demucs_model = demucs_patch["original"]
+
+def autocast(separator, device: str):
+    """torch.autocast with the dtype load_separator picked, or a no-op for fp32."""
+    import torch
+
+    autocast_dtype = getattr(separator, "autocast_dtype", None)
+    if autocast_dtype is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.split(":")[0], dtype=autocast_dtype)
+
+@functools.lru_cache(maxsize=1)
 def get_available_devices():
-    """Get list of available compute devices."""
+    """
+    Get list of available compute devices.
+
+    Cached: querying device names initializes the CUDA context, and the list
+    doesn't change while the process runs (--serve asks for it on every load).
+    """
     devices = [{"id": "cpu", "name": "CPU", "type": "cpu"}]
     
     try:
@@ -63,17 +608,10 @@ def get_available_devices():
             # DirectML can have multiple devices (e.g., RX 9070 and 780M)
             dml_device_count = torch_directml.device_count()
             for i in range(dml_device_count):
-                dml_device = torch_directml.device(i)
-                device_name = f"DirectML GPU {i}"
-                # Try to get device name if available
-                try:
-                    # DirectML doesn't always expose device names, but we can try
-                    device_name = f"DirectML GPU {i}"
-                except:
-                    pass
+                # DirectML doesn't expose device names
                 devices.append({
                     "id": f"directml:{i}" if dml_device_count > 1 else "directml",
-                    "name": device_name,
+                    "name": f"DirectML GPU {i}",
                     "type": "directml"
                 })
         except ImportError:
@@ -91,11 +629,14 @@ def get_available_devices():
     
     return devices
 
-def select_device(requested_device:  str = "auto"):
-    """Select the compute device based on user preference."""
-    import torch
-    
-    available = get_available_devices()
+def select_device(requested_device:  str = "auto", available: list = None):
+    """Select the compute device based on user preference, from get_available_devices() by default."""
+    if requested_device == "cpu":
+        # No need to import torch and enumerate GPUs
+        return "cpu", "CPU"
+
+    if available is None:
+        available = get_available_devices()
     available_ids = [d["id"] for d in available]
     
     if requested_device == "auto":
@@ -105,9 +646,6 @@ def select_device(requested_device:  str = "auto"):
                 return dev["id"], dev["name"]
         return "cpu", "CPU"
     
-    elif requested_device == "cpu":
-        return "cpu", "CPU"
-    
     elif requested_device in available_ids:
         for dev in available:
             if dev["id"] == requested_device:
@@ -117,227 +655,764 @@ def select_device(requested_device:  str = "auto"):
     print(f"WARNING:  Requested device '{requested_device}' not available, using CPU", file=sys.stderr)
     return "cpu", "CPU"
 
-def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs", device_preference: str = "auto"):
+@functools.lru_cache(maxsize=8)
+def get_separator_device(device: str):
+    """Translate a device id from select_device into the form audio-separator expects."""
+    if device == "cpu":
+        return "cpu"
+    if device == "directml" or device.startswith("directml:"):
+        # DirectML uses special handling for audio-separator
+        # audio-separator expects "privateuseone:0" for DirectML
+        try:
+            import torch_directml
+        except ImportError:
+            print("WARNING: DirectML requested but torch-directml not installed, using CPU", file=sys.stderr)
+            return "cpu"
+        # Extract device index: directml:0 -> privateuseone:0
+        device_idx = device.split(":")[1] if ":" in device else "0"
+        return f"privateuseone:{device_idx}"
+    # cuda:N or rocm:N format - pass through as-is
+    return device
+
+def configure_tensorrt(separator, device: str, fp16: bool = True):
     """
-    Separate audio into stems using audio-separator.
+    Put TensorRT in front of CUDA in the Separator's ONNX Runtime providers.
+
+    Only ONNX models (MDX) are affected. Built engines are cached on disk, so
+    only the first run with a given model and segment shape pays the build.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return
+    if "TensorrtExecutionProvider" not in ort.get_available_providers():
+        print("WARNING: TensorRT execution provider not available, using CUDA", file=sys.stderr)
+        return
+
+    trt_cache_dir = CACHE_DIR / "trt"
+    trt_cache_dir.mkdir(parents=True, exist_ok=True)
+    device_id = int(device.split(":")[1]) if ":" in device else 0
+    separator.onnx_execution_provider = [
+        ("TensorrtExecutionProvider", {
+            "device_id": device_id,
+            "trt_fp16_enable": fp16,
+            "trt_engine_cache_enable": True,
+            "trt_engine_cache_path": str(trt_cache_dir),
+            "trt_timing_cache_enable": True,
+            "trt_timing_cache_path": str(trt_cache_dir),
+        }),
+        ("CUDAExecutionProvider", {"device_id": device_id}),
+    ]
+    print(f"Using TensorRT for ONNX models (engine cache: {trt_cache_dir})", file=sys.stderr)
+
+def get_auto_batch_size(device: str):
+    """Default MDX/MDXC batch size: 1 on CPU/DirectML, else what fits in free CUDA memory."""
+    if not device.startswith("cuda"):
+        return 1
+    try:
+        import torch
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+    except Exception:
+        return 1
+    return int(max(1, min(MAX_AUTO_BATCH_SIZE, free // BATCH_WINDOW_GPU_MEMORY)))
+
+def get_autocast_dtype(device: str, precision: str = "auto"):
+    """
+    Autocast dtype for a device and --precision value, or None for plain fp32.
+
+    Conv/matmul run in reduced precision under autocast, while the STFT and the
+    weights stay fp32 (htdemucs' spectrogram branch needs fp32).
+    """
+    if precision == "fp32":
+        return None
+    if not device.startswith("cuda"):
+        if precision != "auto":
+            print(f"WARNING: {precision} is only supported on CUDA, using fp32 on {device}", file=sys.stderr)
+        return None
+
+    import torch
+    if precision == "auto":
+        if torch.version.hip:
+            # ROCm: reduced-precision kernels are not reliably faster or correct on consumer cards
+            return None
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    if precision == "bf16" and not torch.cuda.is_bf16_supported():
+        print("WARNING: bf16 is not supported on this GPU, using fp16", file=sys.stderr)
+        return torch.float16
+    return torch.bfloat16 if precision == "bf16" else torch.float16
+
+def load_separator(model_name: str = "htdemucs", device_preference: str = "auto", output_dir: str = None,
+                   verbose: bool = False, precision: str = "auto", trt: bool = False,
+                   memory_fraction: float = None, threads: int = None, segment: int = None,
+                   overlap: float = None, int8: bool = False, batch_size: int = None,
+                   compile: bool = False, progress=emit_progress):
+    """
+    Create an audio-separator Separator and load the model into it.
 
     Args:
-        input_file: Path to input audio file
-        output_dir: Directory to write output stems
         model_name: Model to use for separation (htdemucs, htdemucs_ft, htdemucs_6s)
         device_preference: Device to use (auto, cpu, cuda:0, cuda:1, directml)
+        output_dir: Initial output directory (can be changed per file)
+        verbose: Let audio-separator log at DEBUG level (default: warnings only)
+        precision: auto (bf16/fp16 autocast on CUDA, fp32 on ROCm/DirectML/CPU), fp32, fp16, or bf16
+        trt: Run ONNX (MDX) models with the TensorRT execution provider on CUDA
+        memory_fraction: Cap this process' share of the CUDA device's memory (0-1)
+        threads: Number of CPU threads for torch (default: OMP_NUM_THREADS)
+        segment: Demucs segment length in seconds (default: the model's own)
+        overlap: Demucs overlap between segments, 0-1 (default: 0.25)
+        int8: Quantize Linear/LSTM layers to int8 (CPU only)
+        batch_size: Windows per forward pass for MDX/MDXC models (default: fit free GPU memory)
+        compile: torch.compile PyTorch models (CUDA only)
+        progress: Callable used to report loading progress (default: emit_progress)
 
     Returns:
-        dict: Paths to output stem files
+        tuple: (separator, device, device_name)
     """
     from audio_separator.separator import Separator
-    import threading
-    import time
-
-    # Map short names to full model names used by audio-separator
-    model_mapping = {
-        'htdemucs':  'htdemucs.yaml',
-        'htdemucs_ft': 'htdemucs_ft.yaml',
-        'htdemucs_6s': 'htdemucs_6s.yaml',
-        'hdemucs_mmi': 'hdemucs_mmi.yaml',
-    }
-
-    full_model_name = model_mapping.get(model_name, model_name)
-    os.makedirs(output_dir, exist_ok=True)
 
-    emit_progress(0, "Initializing")
+    full_model_name = MODEL_MAPPING.get(model_name, model_name)
+
+    progress(0, "Initializing")
     print(f"Loading model: {full_model_name} (from {model_name})", file=sys.stderr)
-    print(f"Input:  {input_file}", file=sys.stderr)
-    print(f"Output:  {output_dir}", file=sys.stderr)
 
     # Select device
-    import torch
-    device, device_name = select_device(device_preference)
+    # Skipped for CPU, where enumerating GPUs is wasted work (and initializes CUDA)
+    available = get_available_devices() if device_preference != "cpu" else []
+    device, device_name = select_device(device_preference, available)
     print(f"Device preference: {device_preference}", file=sys.stderr)
     print(f"Selected device: {device} ({device_name})", file=sys.stderr)
     
     # Show available devices
-    available = get_available_devices()
-    print(f"Available devices:", file=sys.stderr)
-    for dev in available:
-        marker = " <-- SELECTED" if dev["id"] == device else ""
-        print(f"  - {dev['id']}:  {dev['name']}{marker}", file=sys.stderr)
-
-    # Progress emitter thread for model loading phase
-    loading_done = threading.Event()
-    loading_progress = [0]
-
-    def loading_progress_thread():
-        start_time = time.time()
-        while not loading_done.is_set():
-            elapsed = time.time() - start_time
-            progress_ratio = 1 - (0.5 ** (elapsed / 15))
-            percent = int(1 + progress_ratio * 9)
-            percent = min(10, percent)
-            loading_progress[0] = percent
-
-            if elapsed < 60:
-                emit_progress(percent, f"Loading model ({elapsed:.0f}s) [{device_name}]")
-            else: 
-                mins = int(elapsed) // 60
-                secs = int(elapsed) % 60
-                emit_progress(percent, f"Loading model ({mins}:{secs:02d}) [{device_name}]")
-
-            loading_done.wait(0.4)
-
-    loading_worker = threading.Thread(target=loading_progress_thread, daemon=True)
-    loading_worker.start()
-
-    emit_progress(1, f"Initializing [{device_name}]")
-
-    # Determine device parameters for separator
-    # Handle different device types
-    if device == "cpu":
-        separator_device = "cpu"
-    elif device == "directml" or device.startswith("directml:"):
-        # DirectML uses special handling for audio-separator
-        # audio-separator expects "privateuseone:0" for DirectML
-        try:
-            import torch_directml
-            if device == "directml":
-                separator_device = "privateuseone:0"
-            elif device.startswith("directml:"):
-                # Extract device index: directml:0 -> privateuseone:0
-                device_idx = device.split(":")[1]
-                separator_device = f"privateuseone:{device_idx}"
-            else:
-                separator_device = "privateuseone:0"
-        except ImportError:
-            separator_device = "cpu"
-            print("WARNING: DirectML requested but torch-directml not installed, using CPU", file=sys.stderr)
-    else:
-        # cuda:N or rocm:N format - pass through as-is
-        separator_device = device
+    if device != "cpu":
+        print(f"Available devices:", file=sys.stderr)
+        for dev in available:
+            marker = " <-- SELECTED" if dev["id"] == device else ""
+            print(f"  - {dev['id']}:  {dev['name']}{marker}", file=sys.stderr)
+
+    progress(1, f"Initializing [{device_name}]")
+
+    if device.startswith("cuda"):
+        import torch
+        # Windows have a fixed shape, so let cuDNN autotune its conv algorithms once
+        torch.backends.cudnn.benchmark = True
+        if precision != "fp32":
+            # TF32 Tensor Cores for the fp32 matmuls/convs autocast leaves alone (Ampere+)
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+
+    if memory_fraction and device.startswith("cuda"):
+        import torch
+        torch.cuda.set_per_process_memory_fraction(memory_fraction, torch.device(device))
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    separator_device = get_separator_device(device)
+
+    autocast_dtype = get_autocast_dtype(device, precision)
+
+    demucs_params = dict(DEMUCS_PARAMS, device=separator_device)
+    if segment:
+        if full_model_name.startswith("htdemucs") and segment > HTDEMUCS_MAX_SEGMENT:
+            print(f"WARNING: {model_name} supports segments up to {HTDEMUCS_MAX_SEGMENT}s, "
+                  f"using {HTDEMUCS_MAX_SEGMENT} instead of {segment}", file=sys.stderr)
+            segment = HTDEMUCS_MAX_SEGMENT
+        demucs_params["segment_size"] = segment
+    if overlap is not None:
+        demucs_params["overlap"] = overlap
+
+    if batch_size is None:
+        batch_size = get_auto_batch_size(device)
+    mdx_params = dict(MDX_PARAMS, device=separator_device, batch_size=batch_size)
+    mdxc_params = dict(MDXC_PARAMS, batch_size=batch_size)
 
     # Initialize separator
     separator = Separator(
+        model_file_dir=str(MODEL_DIR),
         output_dir=output_dir,
         output_format="WAV",
         normalization_threshold=0.9,
-        log_level=10,  # DEBUG
-        mdx_params={"device": separator_device},
-        demucs_params={"device": separator_device}
+        # DEBUG logs every chunk to stderr during inference; keep that opt-in
+        log_level=logging.DEBUG if verbose else logging.WARNING,
+        # Autocast is applied by run_separation, which can also pick bf16
+        use_autocast=False,
+        mdx_params=mdx_params,
+        mdxc_params=mdxc_params,
+        demucs_params=demucs_params
     )
 
-    emit_progress(3, f"Loading AI model [{device_name}]")
+    if trt and device.startswith("cuda"):
+        configure_tensorrt(separator, device, fp16=precision != "fp32")
+    separator.autocast_dtype = autocast_dtype
+
+    progress(5, f"Loading AI model [{device_name}]")
 
     # Load model
-    separator.load_model(full_model_name)
+    with model_load_lock:
+        separator.load_model(full_model_name)
 
-    loading_done.set()
-    loading_worker.join(timeout=1.0)
+    progress(10, f"Model loaded [{device_name}]")
 
-    emit_progress(11, f"Starting separation [{device_name}]")
+    model_hooks = []
+    if int8:
+        if device != "cpu":
+            print("WARNING: int8 is only supported on CPU, ignoring --int8", file=sys.stderr)
+        else:
+            model_hooks.append(quantize_int8)
+    if compile:
+        if not device.startswith("cuda"):
+            print("WARNING: compile is only supported on CUDA, ignoring --compile", file=sys.stderr)
+        else:
+            model_hooks.append(compile_model)
 
-    # Get audio duration for progress estimation
-    duration_seconds = 0
-    try:
-        import soundfile as sf
-        info = sf.info(input_file)
-        duration_seconds = info.duration
-        print(f"Audio duration: {duration_seconds:.1f}s", file=sys.stderr)
-    except Exception: 
-        duration_seconds = 180
-
-    # Estimate processing time based on device
-    if device == "cpu":
-        estimated_time = duration_seconds * 4.0  # CPU is slower
-        print("Using CPU - processing will be slower", file=sys.stderr)
-    else:
-        estimated_time = duration_seconds * 0.5  # GPU is faster
-        print(f"Using GPU:  {device_name}", file=sys.stderr)
+    if model_hooks:
+        import torch
+        from audio_separator.separator.architectures import demucs_separator
+        model_run = getattr(separator.model_instance, "model_run", None)
+        if isinstance(model_run, torch.nn.Module):
+            # MDXC/Roformer: the PyTorch model is already loaded
+            for hook in model_hooks:
+                model_run = hook(model_run)
+            separator.model_instance.model_run = model_run
+        elif not isinstance(separator.model_instance, demucs_separator.DemucsSeparator):
+            # MDX models run through ONNX Runtime
+            print("WARNING: --int8 and --compile only apply to PyTorch models, ignoring them", file=sys.stderr)
+            model_hooks = []
+    # Demucs loads its model in separate(); see demucs_loader
+    separator.model_hooks = model_hooks
+    separator.demucs_models = {}
+
+    return separator, device, device_name
+
+def run_separation(separator, input_file: str, output_dir: str, device: str, device_name: str,
+                   progress=emit_progress, preloaded=None):
+    """
+    Separate one file with an already loaded Separator.
 
-    print(f"Estimated processing time: {estimated_time:.0f}s", file=sys.stderr)
+    Args:
+        separator: Separator returned by load_separator
+        input_file: Path to input audio file
+        output_dir: Directory to write output stems
+        device: Device id returned by load_separator
+        device_name: Display name of the device
+        progress: Callable used to report progress (default: emit_progress)
+        preloaded: Future resolving to load_input's (info, mix) for this file
 
-    # Progress emitter thread
-    processing_done = threading.Event()
+    Returns:
+        dict: Paths to output stem files
+    """
+    import torch
 
-    def progress_thread():
-        start_time = time.time()
-        last_percent = 11
+    os.makedirs(output_dir, exist_ok=True)
+    separator.output_dir = output_dir
+    separator.model_instance.output_dir = output_dir
+    print(f"Input:  {input_file}", file=sys.stderr)
+    print(f"Output:  {output_dir}", file=sys.stderr)
 
-        while not processing_done.is_set():
-            elapsed = time.time() - start_time
-            if estimated_time > 0:
-                progress_ratio = 1 - (0.5 ** (elapsed / estimated_time))
-                percent = int(12 + progress_ratio * 76)
-            else:
-                percent = min(88, int(12 + elapsed * 2))
-
-            percent = min(88, max(last_percent, percent))
-            last_percent = percent
-
-            mins_elapsed = int(elapsed) // 60
-            secs_elapsed = int(elapsed) % 60
-
-            if percent > 15:
-                progress_fraction = (percent - 12) / 78.0
-                if progress_fraction > 0.05:
-                    total_est = elapsed / progress_fraction
-                    remaining = max(0, total_est - elapsed)
-                    mins_remaining = int(remaining) // 60
-                    secs_remaining = int(remaining) % 60
-                    eta_str = f" | ETA {mins_remaining}:{secs_remaining: 02d}"
-                else:
-                    eta_str = ""
-            else:
-                eta_str = ""
+    progress(11, f"Starting separation [{device_name}]")
+
+    info, mix = preloaded.result() if preloaded is not None else (None, None)
+    if info is None:
+        info = probe_audio(input_file)
+    if info is not None:
+        print(f"Audio duration: {info.duration:.1f}s", file=sys.stderr)
 
-            emit_progress(percent, f"Processing ({mins_elapsed}:{secs_elapsed:02d}{eta_str}) [{device_name}]")
-            processing_done.wait(0.3)
+    if device == "cpu":
+        print("Using CPU - processing will be slower", file=sys.stderr)
+    else:
+        print(f"Using GPU:  {device_name}", file=sys.stderr)
 
-    progress_worker = threading.Thread(target=progress_thread, daemon=True)
-    progress_worker.start()
+    # Demucs runs one progress bar per shift and per model in the bag
+    model_instance = separator.model_instance
+    passes = max(1, getattr(model_instance, "shifts", 1) or 1)
+    model_data = getattr(model_instance, "model_data", None) or {}
+    if isinstance(model_data.get("models"), list):
+        passes *= len(model_data["models"])
 
     print("Processing...", file=sys.stderr)
-    try:
-        output_files = separator.separate(input_file)
-    finally:
-        processing_done.set()
-        progress_worker.join(timeout=1.0)
+    with redirect_tqdm(ProgressSink(12, 88, device_name, passes, progress)):
+        with background_writes(model_instance), preloaded_mix(model_instance, input_file, info, mix), \
+                demucs_loader(separator), autocast(separator, device), torch.inference_mode():
+            output_files = separator.separate(input_file)
 
-    emit_progress(92, "Writing stems")
+    progress(92, "Writing stems")
 
     print(f"Raw output files: {output_files}", file=sys.stderr)
 
     # Rename outputs to standard names
     result = {}
-    stem_mapping = {
-        'vocals': ['vocals', 'vocal', 'Vocals'],
-        'drums':  ['drums', 'drum', 'Drums'],
-        'bass': ['bass', 'Bass'],
-        'other': ['other', 'Other', 'no_vocals', 'instrumental', 'Instrumental'],
-        'guitar': ['guitar', 'Guitar'],
-        'piano': ['piano', 'Piano', 'keys', 'Keys']
-    }
-
     for output_file in output_files: 
         if not os.path.isabs(output_file):
             output_file = os.path.join(output_dir, output_file)
 
-        filename = Path(output_file).stem.lower()
-
-        for stem_name, patterns in stem_mapping.items():
-            for pattern in patterns: 
-                if pattern.lower() in filename:
-                    new_path = os.path.join(output_dir, f"{stem_name}.wav")
-                    if output_file != new_path:
-                        if os.path.exists(new_path):
-                            os.remove(new_path)
-                        import shutil
-                        shutil.move(output_file, new_path)
-                    result[stem_name] = new_path
-                    print(f"  {stem_name}:  {new_path}", file=sys.stderr)
-                    break
-
-    emit_progress(100, "Complete")
+        stem_name = get_stem_name(Path(output_file).stem)
+        if stem_name is None:
+            continue
+        if not os.path.exists(output_file):
+            # audio-separator skips writing near-silent stems
+            print(f"WARNING: {stem_name} was not written ({output_file}), skipping it", file=sys.stderr)
+            continue
+
+        new_path = os.path.join(output_dir, f"{stem_name}.wav")
+        if output_file != new_path:
+            try:
+                # Same directory, so this is an atomic rename that also replaces an old stem
+                os.replace(output_file, new_path)
+            except OSError as e:
+                # e.g. the old stem is still open in REAPER on Windows; the file
+                # is complete where it is, so report that path instead of copying
+                print(f"WARNING: Could not rename {output_file} to {new_path}: {e}", file=sys.stderr)
+                if not os.path.exists(output_file):
+                    continue
+                new_path = output_file
+        result[stem_name] = new_path
+        print(f"  {stem_name}:  {new_path}", file=sys.stderr)
+
+    progress(100, "Complete")
     return result
 
+def separate_stems(input_file: str, output_dir: str, model_name: str = "htdemucs", device_preference: str = "auto",
+                   separator_options: dict = None):
+    """
+    Separate audio into stems using audio-separator.
+
+    Args:
+        input_file: Path to input audio file
+        output_dir: Directory to write output stems
+        model_name: Model to use for separation (htdemucs, htdemucs_ft, htdemucs_6s)
+        device_preference: Device to use (auto, cpu, cuda:0, cuda:1, directml)
+        separator_options: Extra load_separator arguments (verbose, precision, ...)
+
+    Returns:
+        dict: Paths to output stem files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    separator, device, device_name = load_separator(model_name, device_preference, output_dir, **(separator_options or {}))
+    return run_separation(separator, input_file, output_dir, device, device_name)
+
+def get_duration(input_file: str):
+    """Duration of an audio file in seconds, or 0 if it can't be read."""
+    info = probe_audio(input_file)
+    return info.duration if info is not None else 0
+
+def get_batch_concurrency(device: str, job_count: int):
+    """Number of files to separate at once: as many as fit in free GPU memory, up to MAX_AUTO_CONCURRENCY."""
+    if not device.startswith("cuda"):
+        # CPU already uses all cores for one file; DirectML serializes anyway
+        return 1
+    try:
+        import torch
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+    except Exception:
+        return 1
+    return max(1, min(job_count, MAX_AUTO_CONCURRENCY, free // JOB_GPU_MEMORY))
+
+def check_job(job) -> str:
+    """Return why a batch job is malformed, or None if it can be run."""
+    if not isinstance(job, dict):
+        return "Job must be a JSON object"
+    for key in ("input", "output_dir"):
+        if not isinstance(job.get(key), str):
+            return f"Job needs an \"{key}\" path"
+    return None
+
+def reject_invalid_jobs(jobs: list, results: list) -> list:
+    """
+    Fill in an {"error": ...} result for each malformed job.
+
+    Returns:
+        list: Indices of the jobs that can be run
+    """
+    valid = []
+    for index, job in enumerate(jobs):
+        error = check_job(job)
+        if error:
+            print(f"ERROR: Job {index + 1}: {error}", file=sys.stderr)
+            results[index] = {"error": error}
+        else:
+            valid.append(index)
+    return valid
+
+def report_rejected_jobs(results: list, batch_progress):
+    """Count the jobs reject_invalid_jobs failed as finished in the batch progress."""
+    for index, result in enumerate(results):
+        if result is not None:
+            batch_progress.for_job(index)(100, "Failed")
+
+def separate_stems_batch(jobs: list, model_name: str = "htdemucs", device_preference: str = "auto",
+                         concurrency: int = None, separator_options: dict = None):
+    """
+    Separate several files, loading the model once per worker.
+
+    Args:
+        jobs: List of {"input": ..., "output_dir": ...} dicts
+        model_name: Model to use for separation
+        device_preference: Device to use (auto, cpu, cuda:0, cuda:1, directml)
+        concurrency: Files separated at the same time (default: get_batch_concurrency)
+        separator_options: Extra load_separator arguments (verbose, precision, ...)
+
+    Returns:
+        list: Output stems per job, in order ({"error": ...} for failed jobs)
+    """
+    if not jobs:
+        return []
+
+    separator_options = separator_options or {}
+    results = [None] * len(jobs)
+    batch_progress = BatchProgress(len(jobs))
+    valid = reject_invalid_jobs(jobs, results)
+    if not valid:
+        return results
+
+    separator, device, device_name = load_separator(model_name, device_preference, **separator_options)
+    report_rejected_jobs(results, batch_progress)
+    if concurrency is None:
+        concurrency = get_batch_concurrency(device, len(valid))
+    concurrency = max(1, min(concurrency, len(valid)))
+    print(f"Separating {len(valid)} files, {concurrency} at a time", file=sys.stderr)
+
+    # A Separator holds per-file state, so each worker gets its own. Their loading
+    # isn't reported: it would restart the progress from 0 after the first load
+    separators = [separator] + [load_separator(model_name, device, progress=lambda percent, stage="": None,
+                                               **separator_options)[0]
+                                for _ in range(concurrency - 1)]
+    free_separators = list(separators)
+    separators_lock = threading.Lock()
+
+    def run_job(index: int, preloaded=None):
+        job = jobs[index]
+        progress = batch_progress.for_job(index)
+        with separators_lock:
+            job_separator = free_separators.pop()
+        try:
+            return run_separation(job_separator, job["input"], job["output_dir"], device, device_name, progress,
+                                  preloaded)
+        except Exception as e:
+            print(f"ERROR: {job.get('input')}: {e}", file=sys.stderr)
+            progress(100, "Failed")
+            return {"error": str(e)}
+        finally:
+            with separators_lock:
+                free_separators.append(job_separator)
+
+    if concurrency == 1:
+        # One file at a time: decode the next file in the background while
+        # the current one is being separated
+        sample_rate = getattr(separator.model_instance, "sample_rate", None)
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_input = prefetcher.submit(load_input, jobs[valid[0]]["input"], sample_rate)
+            for position, index in enumerate(valid):
+                current_input = next_input
+                if position + 1 < len(valid):
+                    next_input = prefetcher.submit(load_input, jobs[valid[position + 1]]["input"], sample_rate)
+                results[index] = run_job(index, current_input)
+        return results
+
+    # Start the longest files first so the workers finish at about the same time
+    order = sorted(valid, key=lambda index: get_duration(jobs[index]["input"]), reverse=True)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, result in zip(order, pool.map(run_job, order)):
+            results[index] = result
+    return results
+
+# Per-process state of --parallel workers, set up by init_parallel_worker
+worker_state = {}
+
+def init_parallel_worker(model_name: str, device_preference: str, separator_options: dict, progress_queue):
+    """Pool initializer: load this worker's Separator once; progress goes through the queue."""
+    global progress_fd
+    # Loading progress from every worker would garble the parent's stream
+    progress_fd = os.open(os.devnull, os.O_WRONLY)
+    worker_state["separator"] = load_separator(model_name, device_preference, **separator_options)
+    worker_state["progress_queue"] = progress_queue
+
+def run_parallel_job(index: int, job: dict):
+    """Separate one batch job in a --parallel worker process."""
+    separator, device, device_name = worker_state["separator"]
+    progress_queue = worker_state["progress_queue"]
+
+    def progress(percent: float, stage: str = ""):
+        progress_queue.put((index, percent, stage))
+
+    try:
+        return run_separation(separator, job["input"], job["output_dir"], device, device_name, progress)
+    except Exception as e:
+        print(f"ERROR: {job.get('input')}: {e}", file=sys.stderr)
+        progress(100, "Failed")
+        return {"error": str(e)}
+
+def separate_stems_parallel(jobs: list, model_name: str = "htdemucs", device_preference: str = "auto",
+                            processes: int = 2, separator_options: dict = None):
+    """
+    Separate several files in a pool of worker processes, one Separator each.
+
+    Workers are started from a forkserver that has torch and audio-separator
+    imported already (spawn where forkserver isn't available, e.g. Windows).
+    CUDA is only initialized inside the workers.
+
+    Args:
+        jobs: List of {"input": ..., "output_dir": ...} dicts
+        model_name: Model to use for separation
+        device_preference: Device to use (auto, cpu, cuda:0, cuda:1, directml)
+        processes: Number of worker processes
+        separator_options: Extra load_separator arguments (verbose, precision, ...)
+
+    Returns:
+        list: Output stems per job, in order ({"error": ...} for failed jobs)
+    """
+    import multiprocessing
+
+    if not jobs:
+        return []
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["torch", "audio_separator.separator", "numpy", "soundfile"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    results = [None] * len(jobs)
+    batch_progress = BatchProgress(len(jobs))
+    valid = reject_invalid_jobs(jobs, results)
+    if not valid:
+        return results
+    report_rejected_jobs(results, batch_progress)
+
+    processes = max(1, min(processes, len(valid)))
+    print(f"Separating {len(valid)} files in {processes} processes", file=sys.stderr)
+    separator_options = dict(separator_options or {})
+    if not separator_options.get("threads"):
+        # Share the default thread pool between the workers instead of each taking all of it
+        separator_options["threads"] = max(1, int(os.environ["OMP_NUM_THREADS"]) // processes)
+
+    # Relay the workers' progress into one combined stream
+    progress_queue = context.Queue()
+
+    def relay_progress():
+        for index, percent, stage in iter(progress_queue.get, None):
+            batch_progress.for_job(index)(percent, stage)
+
+    relay = threading.Thread(target=relay_progress, daemon=True)
+    relay.start()
+
+    # Longest files first so the workers finish at about the same time
+    order = sorted(valid, key=lambda index: get_duration(jobs[index]["input"]), reverse=True)
+    try:
+        with context.Pool(processes, initializer=init_parallel_worker,
+                          initargs=(model_name, device_preference, separator_options, progress_queue)) as pool:
+            ordered_results = pool.starmap(run_parallel_job, [(index, jobs[index]) for index in order], chunksize=1)
+        for index, result in zip(order, ordered_results):
+            results[index] = result
+    finally:
+        progress_queue.put(None)
+        relay.join()
+    return results
+
+def get_cached_separator(separators: dict, model_name: str, device_preference: str, separator_options: dict = None):
+    """Return (separator, device, device_name) for a model/device pair, loading it on first use."""
+    key = (model_name, device_preference)
+    if key not in separators:
+        separators[key] = load_separator(model_name, device_preference, **(separator_options or {}))
+    return separators[key]
+
+def get_runtime_dir():
+    """
+    Per-user directory for daemon sockets: $XDG_RUNTIME_DIR, or a private
+    stemperator-<uid> directory in the temp dir (created with mode 0700).
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return runtime_dir
+    runtime_dir = os.path.join(tempfile.gettempdir(), f"stemperator-{os.getuid()}")
+    os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+    stat = os.lstat(runtime_dir)
+    # The temp dir is shared: refuse a directory someone else created or opened up
+    if not os.path.isdir(runtime_dir) or os.path.islink(runtime_dir) \
+            or stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise RuntimeError(f"{runtime_dir} is not a private directory owned by the current user")
+    return runtime_dir
+
+def get_socket_address(model_name: str = "htdemucs", device_preference: str = "auto"):
+    """Default daemon address: a named pipe on Windows, a Unix socket elsewhere."""
+    name = f"stemperator-{model_name}-{device_preference}".replace(":", "-")
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{name}"
+    return os.path.join(get_runtime_dir(), f"{name}.sock")
+
+def get_auth_key():
+    """
+    Shared secret between the daemon and its clients, kept in the user's cache dir.
+
+    Connections that can't prove they know it are refused, so other local
+    users can't submit jobs even when the socket itself is reachable.
+    """
+    key_file = CACHE_DIR / "daemon.key"
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        key = key_file.read_bytes()
+    except FileNotFoundError:
+        key = b""
+    if len(key) >= AUTH_KEY_SIZE:
+        return key
+
+    # Write the key completely before it appears under its name, so no process
+    # ever reads a partial one (mkstemp creates the file with mode 0600)
+    fd, tmp_name = tempfile.mkstemp(dir=CACHE_DIR, prefix=".daemon.key.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(AUTH_KEY_SIZE))
+        try:
+            # Atomic and fails if the key exists, so the first process to get here wins
+            os.link(tmp_name, key_file)
+        except FileExistsError:
+            if len(key_file.read_bytes()) < AUTH_KEY_SIZE:
+                # Truncated or empty key left behind by an older version or a crash
+                os.replace(tmp_name, key_file)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_name)
+    return key_file.read_bytes()
+
+class ClientDisconnected(Exception):
+    """The daemon's client went away while its job was running."""
+
+def send_message(conn, message):
+    """Send one JSON message (instead of pickling, which would let a peer run code)."""
+    conn.send_bytes(json.dumps(message).encode("utf-8"))
+
+def recv_message(conn):
+    """Receive one JSON message sent with send_message."""
+    return json.loads(conn.recv_bytes().decode("utf-8"))
+
+def is_socket_live(address: str):
+    """Whether something is listening on a Unix socket (a plain connect, no handshake)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(address)
+        except OSError:
+            return False
+    return True
+
+def serve(model_name: str = "htdemucs", device_preference: str = "auto", separator_options: dict = None):
+    """
+    Load the model once, then separate every file requested on stdin.
+
+    Each stdin line is a JSON object {"input": ..., "output_dir": ...}, with
+    optional "model" and "device" keys (other models are loaded on first use
+    and kept). For each one, PROGRESS lines are written as usual, followed by
+    one JSON line with the output stems (or {"error": ...} if the job failed).
+    """
+    separators = {}
+    _, _, device_name = get_cached_separator(separators, model_name, device_preference, separator_options)
+    emit_progress(100, f"Ready [{device_name}]")
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            separator, device, device_name = get_cached_separator(
+                separators, request.get("model", model_name), request.get("device", device_preference), separator_options)
+            result = run_separation(separator, request["input"], request["output_dir"], device, device_name)
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            result = {"error": str(e)}
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+def serve_socket(address: str, model_name: str = "htdemucs", device_preference: str = "auto",
+                 separator_options: dict = None):
+    """
+    Load the model once, then separate files for clients connecting to address.
+
+    Clients authenticate with get_auth_key(). Each one sends one JSON request
+    {"input", "output_dir"[, "model", "device"]} (or {"command": "shutdown"})
+    and receives ["progress", percent, stage] messages followed by
+    ["result", stems] or ["error", message].
+    Jobs run one at a time; loaded models are kept for later clients.
+    """
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+
+    if sys.platform != "win32" and os.path.exists(address):
+        if is_socket_live(address):
+            raise RuntimeError(f"A daemon is already listening on {address}")
+        # Stale socket left by a daemon that didn't shut down cleanly
+        os.remove(address)
+
+    separators = {}
+    _, _, device_name = get_cached_separator(separators, model_name, device_preference, separator_options)
+
+    with Listener(address, authkey=get_auth_key()) as listener:
+        print(f"Listening on {address}", file=sys.stderr)
+        emit_progress(100, f"Ready [{device_name}]")
+        while True:
+            try:
+                conn = listener.accept()
+            except (EOFError, OSError, AuthenticationError) as e:
+                # Includes clients that hung up during the handshake or lack the key
+                print(f"Rejected connection: {e!r}", file=sys.stderr)
+                continue
+            with conn:
+                try:
+                    try:
+                        request = recv_message(conn)
+                    except ValueError as e:
+                        request = None
+                        print(f"ERROR: Invalid request: {e}", file=sys.stderr)
+                    if not isinstance(request, dict):
+                        send_message(conn, ["error", "Request must be a JSON object"])
+                        continue
+                    if request.get("command") == "shutdown":
+                        send_message(conn, ["result", {}])
+                        break
+
+                    def progress(percent: float, stage: str = ""):
+                        try:
+                            send_message(conn, ["progress", int(percent), stage])
+                        except (EOFError, OSError) as e:
+                            raise ClientDisconnected(e) from e
+
+                    try:
+                        separator, device, device_name = get_cached_separator(
+                            separators, request.get("model", model_name), request.get("device", device_preference),
+                            separator_options)
+                        reply = ["result", run_separation(separator, request["input"], request["output_dir"],
+                                                          device, device_name, progress)]
+                    except ClientDisconnected:
+                        raise
+                    except Exception as e:
+                        # Including OSErrors from the job itself (missing input, disk full...)
+                        print(f"ERROR: {e}", file=sys.stderr)
+                        reply = ["error", str(e)]
+                    send_message(conn, reply)
+                except (EOFError, OSError, ClientDisconnected) as e:
+                    print(f"Client disconnected: {e}", file=sys.stderr)
+
+def run_client(address: str, request: dict):
+    """
+    Send one job to a running daemon, relaying its progress to stdout.
+
+    Raises FileNotFoundError / ConnectionRefusedError if no daemon is listening.
+
+    Returns:
+        dict: Paths to output stem files
+    """
+    from multiprocessing.connection import Client
+
+    with Client(address, authkey=get_auth_key()) as conn:
+        send_message(conn, request)
+        while True:
+            kind, *payload = recv_message(conn)
+            if kind == "progress":
+                emit_progress(*payload)
+            elif kind == "result":
+                return payload[0]
+            else:
+                raise RuntimeError(payload[0])
+
 def check_installation():
     """Check if audio-separator is properly installed."""
     try:
@@ -373,10 +1448,17 @@ def list_devices():
         print(f"  {dev['id']}:  {dev['name']} ({dev['type']})")
     return devices
 
+def overlap_fraction(value: str) -> float:
+    """argparse type for --overlap: a fraction in [0, 1)."""
+    overlap = float(value)
+    if not 0 <= overlap < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 0 and less than 1, got {value}")
+    return overlap
+
 def main():
     parser = argparse.ArgumentParser(description="Audio Separator for STEMperator")
-    parser.add_argument("input", nargs="?", help="Input audio file")
-    parser.add_argument("output_dir", nargs="?", help="Output directory for stems")
+    parser.add_argument("paths", nargs="*", metavar="input",
+                        help="Input audio file(s), followed by the output directory for stems")
     parser.add_argument("--model", default="htdemucs",
                         help="Model to use (htdemucs, htdemucs_ft, htdemucs_6s, etc.)")
     parser.add_argument("--device", default="auto",
@@ -387,9 +1469,63 @@ def main():
                         help="List available models")
     parser.add_argument("--list-devices", action="store_true",
                         help="List available compute devices")
+    parser.add_argument("--serve", action="store_true",
+                        help="Load the model once and separate JSON jobs read from stdin")
+    parser.add_argument("--socket", nargs="?", const="", default=None, metavar="ADDRESS",
+                        help="With --serve: listen on a local socket instead of stdin. "
+                             "With --client: daemon to connect to (default: per model/device)")
+    parser.add_argument("--client", action="store_true",
+                        help="Run the job on a --serve --socket daemon instead of loading the model here")
+    parser.add_argument("--progress-fd", type=int, default=1,
+                        help="File descriptor to write PROGRESS lines to (default: 1, stdout)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show audio-separator debug logging")
+    parser.add_argument("--precision", default="auto", choices=["auto", "fp32", "fp16", "bf16"],
+                        help="Inference precision: auto (bf16, or fp16 on GPUs without bf16, on NVIDIA; "
+                             "fp32 on ROCm, DirectML and CPU), fp32, fp16, bf16 (CUDA only)")
+    parser.add_argument("--memory-fraction", type=float, default=None,
+                        help="Limit this process to a fraction of the GPU's memory (e.g. 0.45 for two workers)")
+    parser.add_argument("--segment", "--segment-size", type=int, default=None, metavar="SECONDS",
+                        help="Demucs segment length. Longer segments mean fewer overlapping windows (faster) "
+                             "but more memory; htdemucs models are limited to 7 (default: model's own)")
+    parser.add_argument("--overlap", type=overlap_fraction, default=None,
+                        help="Overlap between Demucs segments, 0-1. Lower is faster, higher smooths "
+                             "segment borders (default: 0.25)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Windows per forward pass for MDX/MDXC models (default: 1 on CPU, "
+                             "up to 8 on CUDA depending on free memory)")
+    parser.add_argument("--int8", action="store_true",
+                        help="Quantize the model to int8 for faster CPU inference (CPU only)")
+    parser.add_argument("--compile", action="store_true",
+                        help="Compile the model with torch.compile (CUDA only, the first run takes longer)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads for inference (default: half the logical CPUs, "
+                             "shared between --parallel workers)")
+    parser.add_argument("--trt", action="store_true",
+                        help="Use TensorRT for ONNX (MDX) models on CUDA; the first run builds a cached engine")
+    parser.add_argument("--batch-manifest",
+                        help="JSON file with a list of {input, output_dir} jobs to separate")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Files to separate at once with --batch-manifest (default: up to 2, if they fit in GPU memory)")
+    parser.add_argument("--parallel", type=int, default=1, metavar="N",
+                        help="Separate several files in N worker processes instead of threads")
 
     args = parser.parse_args()
 
+    global progress_fd
+    progress_fd = args.progress_fd
+
+    if args.threads:
+        # torch hasn't been imported yet, so its OpenMP pool picks this up
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(args.threads)
+    if args.device == "cpu" and not (args.serve or args.check or args.list_devices or args.list_models):
+        # Hide the GPUs before torch is imported, so it never loads the CUDA driver.
+        # Only when separating here: daemon requests may still ask for a CUDA
+        # device, and --check / --list-devices must report the real ones
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    inputs, output_dir = args.paths[:-1], (args.paths[-1] if len(args.paths) > 1 else None)
+
     if args.check:
         if check_installation():
             print("\nInstallation OK!")
@@ -411,21 +1547,79 @@ def main():
         print("  Kim_Vocal_2 - Alternative vocal model")
         sys.exit(0)
 
-    if not args.input or not args.output_dir:
+    separator_options = {"verbose": args.verbose, "precision": args.precision, "trt": args.trt,
+                         "memory_fraction": args.memory_fraction, "threads": args.threads,
+                         "segment": args.segment, "overlap": args.overlap, "int8": args.int8,
+                         "batch_size": args.batch_size, "compile": args.compile}
+    def run_batch(jobs):
+        if args.parallel > 1:
+            return separate_stems_parallel(jobs, args.model, args.device, args.parallel, separator_options)
+        return separate_stems_batch(jobs, args.model, args.device, args.jobs, separator_options)
+
+    if args.serve:
+        if args.socket is not None:
+            try:
+                address = args.socket or get_socket_address(args.model, args.device)
+                serve_socket(address, args.model, args.device, separator_options)
+            except RuntimeError as e:
+                print(f"ERROR: {e}", file=sys.stderr)
+                sys.exit(1)
+        else:
+            serve(args.model, args.device, separator_options)
+        sys.exit(0)
+
+    if args.batch_manifest:
+        try:
+            with open(args.batch_manifest, encoding="utf-8") as f:
+                jobs = json.load(f)
+            if not isinstance(jobs, list):
+                raise ValueError("The batch manifest must be a JSON list of jobs")
+            results = run_batch(jobs)
+            print(json.dumps(results))
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    if not inputs or not output_dir:
         parser.print_help()
         sys.exit(1)
 
-    if not os.path.exists(args.input):
-        print(f"ERROR: Input file not found: {args.input}", file=sys.stderr)
-        sys.exit(1)
+    for input_file in inputs:
+        if not os.path.exists(input_file):
+            print(f"ERROR: Input file not found: {input_file}", file=sys.stderr)
+            sys.exit(1)
+
+    if len(inputs) > 1:
+        # Several files: share one model load, each file gets its own stem folder
+        jobs = [{"input": input_file, "output_dir": os.path.join(output_dir, Path(input_file).stem)}
+                for input_file in inputs]
+        try:
+            print(json.dumps(run_batch(jobs)))
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+    input_file = inputs[0]
 
     try:
-        output_files = separate_stems(args.input, args.output_dir, args.model, args.device)
+        output_files = None
+        if args.client:
+            request = {"input": os.path.abspath(input_file), "output_dir": os.path.abspath(output_dir),
+                       "model": args.model, "device": args.device}
+            address = args.socket or get_socket_address(args.model, args.device)
+            try:
+                output_files = run_client(address, request)
+            except (FileNotFoundError, ConnectionRefusedError):
+                print(f"No daemon listening on {address}, separating here", file=sys.stderr)
+        if output_files is None:
+            output_files = separate_stems(input_file, output_dir, args.model, args.device, separator_options)
         print(json.dumps(output_files))
 
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
-        import traceback
         traceback.print_exc(file=sys.stderr)
         sys.exit(1)
 